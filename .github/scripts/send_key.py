@@ -1,147 +1,324 @@
 import os
-import requests
-import re
-import email_validator
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-from python_http_client.exceptions import HTTPError
+import sys
 
+REQUIRED_ENVS = ["GITHUB_TOKEN", "GITHUB_SHA", "GITHUB_REPOSITORY", "PROVISIONING_API_KEY", "EMAIL_API_KEY"]
 
-def main():
-    # Environment variable validation
-    required_envs = ["GITHUB_TOKEN", "GITHUB_SHA", "GITHUB_REPOSITORY", "PROVISIONING_API_KEY", "EMAIL_API_KEY"]
-    missing = [env for env in required_envs if env not in os.environ]
+# Fail a misconfigured job before paying for the imports below
+if __name__ == "__main__":
+    missing = [env for env in REQUIRED_ENVS if env not in os.environ]
     if missing:
         print(f"❌ Missing environment variables: {', '.join(missing)}")
         exit(2)
 
+import atexit
+import requests
+import re
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import json
+from functools import lru_cache
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# RE2 compiles to a linear-time automaton, which matters on very long PR
+# threads; the stdlib engine is still fine when google-re2 isn't installed.
+# Addresses are ASCII-only here, so the stdlib patterns use ASCII \b and \s
+# like RE2 does, which also keeps it off the Unicode class lookups.
+try:
+    import re2
+    _compile_email_re = re2.compile
+except ImportError:
+    def _compile_email_re(pattern):
+        return re.compile(pattern, re.ASCII)
+
+# PR bodies and comments are attacker-controlled, so every run is capped at the
+# RFC 5321 limits. Unbounded `+` made each start position rescan to the end of
+# a long run of address characters, which is quadratic in the text length.
+EMAIL_CORE = r"[A-Za-z0-9._%+-]{1,64}@[A-Za-z0-9.-]{1,253}\.[A-Za-z]{2,63}"
+_RE_EMAIL_LABELED = _compile_email_re(
+    rf"(?:(?P<bold>\*\*Email\*\*:)|[Ee]mail:)\s*(?P<email>{EMAIL_CORE})"
+)
+_RE_EMAIL_BARE = _compile_email_re(rf"\b({EMAIL_CORE})\b")
+
+# Everything main needs about the PR (number, body and comments) in one request
+PR_BUNDLE_QUERY = """
+query($owner: String!, $name: String!, $sha: GitObjectID!) {
+  repository(owner: $owner, name: $name) {
+    object(oid: $sha) {
+      ... on Commit {
+        associatedPullRequests(first: 1) {
+          nodes {
+            number
+            body
+            comments(last: 100) {
+              totalCount
+              nodes { body author { login } }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+_EMAIL_HTML_TEMPLATE = """
+    <p>Thank you for contributing to the <strong>goose recipe cookbook</strong>!</p>
+    <p>🎉 Here's your <strong>$10 OpenRouter API key</strong>:</p>
+    <pre style="background-color:#f4f4f4;padding:10px;border-radius:6px;"><code>{api_key}</code></pre>
+    <p>To use this in goose (CLI or Desktop):</p>
+    <ul>
+      <li>Go to your <strong>Provider Settings</strong></li>
+      <li>Select <strong>OpenRouter</strong> from the provider list</li>
+      <li>Paste your API key</li>
+    </ul>
+    <p>📚 Full setup instructions:<br>
+    <a href="https://block.github.io/goose/docs/getting-started/providers/#configure-provider">
+    https://block.github.io/goose/docs/getting-started/providers/#configure-provider</a></p>
+    <p>Happy coding!<br>– the goose team</p>
+"""
+
+def _retrying_adapter(**retry_kwargs):
+    return HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=4,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True,
+            **retry_kwargs
+        )
+    )
+
+# One pooled session for every HTTP call, so connections to each host are reused.
+# Retry only covers idempotent methods by default, so key creation, emails and
+# PR comments are never sent twice.
+SESSION = requests.Session()
+SESSION.mount("https://", _retrying_adapter())
+
+# The GraphQL bundle query is a read-only POST, so it may be retried on any method
+QUERY_SESSION = requests.Session()
+QUERY_SESSION.mount("https://", _retrying_adapter(allowed_methods=None))
+
+# Status lines are written out in one go instead of one unbuffered write each.
+# Errors flush straight away so they appear in order right before an exit.
+_LOG = []
+
+def log(msg):
+    _LOG.append(msg)
+
+def flush_log():
+    if _LOG:
+        sys.stdout.write("\n".join(_LOG) + "\n")
+        sys.stdout.flush()
+        _LOG.clear()
+
+def log_error(msg):
+    log(msg)
+    flush_log()
+
+atexit.register(flush_log)
+
+GITHUB_API = "https://api.github.com"
+
+# Older comments are walked over REST 100 at a time; past this many pages the
+# oldest ones are skipped, so a huge thread can't stall the job
+MAX_COMMENT_PAGES = 5
+
+def github_headers(github_token):
+    return {
+        "Authorization": f"Bearer {github_token}",
+        "Accept": "application/vnd.github+json"
+    }
+
+
+def main():
+    # REQUIRED_ENVS were checked at the top of the script
     GITHUB_TOKEN = os.environ["GITHUB_TOKEN"]
     GITHUB_SHA = os.environ["GITHUB_SHA"]
     REPO_NAME = os.environ["GITHUB_REPOSITORY"]
     PROVISIONING_API_KEY = os.environ["PROVISIONING_API_KEY"]
     SENDGRID_API_KEY = os.environ["EMAIL_API_KEY"]
 
-    pr_number = get_pr_number_from_sha()
-    pr_data = fetch_pr_body(pr_number, GITHUB_TOKEN, REPO_NAME)
-    pr_body = pr_data.get("body", "")
+    pr_data = fetch_pr_bundle(GITHUB_SHA, REPO_NAME, GITHUB_TOKEN)
+    pr_number = pr_data["number"]
+    pr_body = pr_data["body"]
+    comments_url = f"{GITHUB_API}/repos/{REPO_NAME}/issues/{pr_number}/comments"
 
-    email = extract_email(pr_body, REPO_NAME, pr_number, GITHUB_TOKEN)
-    print(f"📬 Found email: {email}")
+    def load_comments():
+        # Over 100 comments: fetch the older ones over REST, only once the PR
+        # body turns out not to hold an email
+        if pr_data["older_comment_count"]:
+            return pr_data["comments"] + fetch_pr_comments(
+                comments_url, GITHUB_TOKEN, pr_data["older_comment_count"]
+            )
+        return pr_data["comments"]
+
+    email = extract_email(pr_body, load_comments)
+    log(f"📬 Found email: {email}")
 
     try:
         api_key = provision_api_key(PROVISIONING_API_KEY)
-        print("✅ API key generated!")
+        log("✅ API key generated!")
 
         if not send_email(email, api_key, SENDGRID_API_KEY):
-            print("❌ Email failed to send. Exiting without PR comment.")
+            log_error("❌ Email failed to send. Exiting without PR comment.")
             exit(2)
 
-        comment_on_pr(GITHUB_TOKEN, REPO_NAME, pr_number, email)
+        comment_on_pr(comments_url, GITHUB_TOKEN, email)
 
     except Exception as err:
-        print(f"❌ An error occurred: {err}")
+        log_error(f"❌ An error occurred: {err}")
         exit(2)
 
-def get_pr_number_from_sha():
-    token = os.getenv("GITHUB_TOKEN")
-    repo = os.getenv("GITHUB_REPOSITORY")
-    sha = os.getenv("GITHUB_SHA")
-
-    url = f"https://api.github.com/repos/{repo}/commits/{sha}/pulls"
-    headers = {
-        "Authorization": f"token {token}",
-        "Accept": "application/vnd.github.groot-preview+json"
-    }
-
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-
-    pr_data = response.json()
-    if pr_data:
-        return pr_data[0]["number"]
-    else:
-        raise Exception("No PR found for this SHA")
+    flush_log()
 
-def fetch_pr_body(pr_number, github_token, repo_full_name):
-    print("🔍 Fetching PR body...")
-    pr_url = f"https://api.github.com/repos/{repo_full_name}/pulls/{pr_number}"
+def fetch_pr_bundle(sha, repo_full_name, github_token):
+    log("🔍 Fetching PR body and comments...")
+    owner, name = repo_full_name.split("/", 1)
     try:
-        pr_resp = requests.get(
-            pr_url,
-            headers={"Authorization": f"Bearer {github_token}"}
+        resp = QUERY_SESSION.post(
+            f"{GITHUB_API}/graphql",
+            headers=github_headers(github_token),
+            json={
+                "query": PR_BUNDLE_QUERY,
+                "variables": {"owner": owner, "name": name, "sha": sha}
+            }
         )
-        pr_resp.raise_for_status()
+        resp.raise_for_status()
     except requests.exceptions.RequestException as e:
-        print("❌ Failed to fetch PR body:", str(e))
+        log_error(f"❌ Failed to fetch PR data: {e}")
         raise
-    return pr_resp.json()
 
-def extract_email_from_text(text):
-    email_match = re.search(r"\*\*Email\*\*:\s*([A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,})", text)
-    if email_match:
-        return email_match.group(1)
-    email_match = re.search(r"[Ee]mail:\s*([A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,})", text)
-    if email_match:
-        return email_match.group(1)
-    email_match = re.search(r"\b([A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,})\b", text)
+    result = _json_loads(resp.content)
+    if result.get("errors"):
+        log_error("❌ Failed to fetch PR data: GraphQL query returned errors")
+        raise Exception(f"GraphQL query failed: {result['errors']}")
+
+    commit = (result["data"]["repository"] or {}).get("object") or {}
+    pr_nodes = commit.get("associatedPullRequests", {}).get("nodes", [])
+    if not pr_nodes:
+        log_error("❌ No PR found for this SHA")
+        raise Exception("No PR found for this SHA")
+
+    pr = pr_nodes[0]
+    # Shape comments like the REST API does, so both sources are interchangeable.
+    # Newest first: the contributor's reply with their email is usually recent.
+    comments = [
+        {"body": c["body"], "user": {"login": (c["author"] or {}).get("login", "unknown")}}
+        for c in reversed(pr["comments"]["nodes"])
+    ]
+    return {
+        "number": pr["number"],
+        "body": pr["body"] or "",
+        "comments": comments,
+        "older_comment_count": pr["comments"]["totalCount"] - len(comments)
+    }
+
+def extract_labeled_email(text):
+    # Prefer "**Email**:" over "Email:", wherever they appear
+    if "@" not in text:
+        return None
+    label_email = None
+    for email_match in _RE_EMAIL_LABELED.finditer(text):
+        if email_match.group("bold") is not None:
+            return email_match.group("email")
+        if label_email is None:
+            label_email = email_match.group("email")
+    return label_email
+
+def extract_bare_email(text):
+    if "@" not in text:
+        return None
+    email_match = _RE_EMAIL_BARE.search(text)
     if email_match:
         return email_match.group(1)
     return None
 
-def fetch_pr_comments(repo_full_name, pr_number, github_token):
-    comments_url = f"https://api.github.com/repos/{repo_full_name}/issues/{pr_number}/comments"
+def fetch_pr_comments(comments_url, github_token, count):
+    # Fetch the oldest `count` comments, newest first, walking pages backwards.
+    # The issue comments endpoint has no sort option, so pages are picked by number.
+    comments = []
+    last_page = (count + 99) // 100
+    if last_page > MAX_COMMENT_PAGES:
+        log(f"⚠️ {count} older PR comments; only checking the newest {MAX_COMMENT_PAGES} pages")
     try:
-        comments_resp = requests.get(
-            comments_url,
-            headers={"Authorization": f"Bearer {github_token}"}
-        )
-        comments_resp.raise_for_status()
-        return comments_resp.json()
-    except requests.exceptions.RequestException as e:
-        print(f"⚠️ Failed to fetch PR comments: {e}")
-        return []
+        for page in range(last_page, max(last_page - MAX_COMMENT_PAGES, 0), -1):
+            comments_resp = SESSION.get(
+                comments_url,
+                headers=github_headers(github_token),
+                params={"per_page": 100, "page": page}
+            )
+            comments_resp.raise_for_status()
+            page_comments = _json_loads(comments_resp.content)[:count - (page - 1) * 100]
+            comments.extend(reversed(page_comments))
+        return comments
+    # ValueError covers a non-JSON body, which resp.json() used to report as a
+    # RequestException; orjson and json both raise a ValueError subclass
+    except (requests.exceptions.RequestException, ValueError) as e:
+        log(f"⚠️ Failed to fetch PR comments: {e}")
+        return comments
+
+@lru_cache(maxsize=128)
+def _validate_cached(email):
+    # The same address often shows up in the body and several comments
+    import email_validator
 
-def validate_email_address(email):
     try:
-        valid_email = email_validator.validate_email(email)
-        normalized_email = valid_email.email
-        print(f"✅ Email validation passed: {normalized_email}")
-        return normalized_email
+        # Syntax only: skip the MX/A lookups, SendGrid reports undeliverable addresses
+        return email_validator.validate_email(email, check_deliverability=False).email, None
     except email_validator.EmailNotValidError as e:
-        print(f"❌ Email validation failed: {e}")
-        return None
+        return None, str(e)
 
-def extract_email(pr_body, repo_full_name, pr_number, github_token):
-    print("🔍 Searching for email in PR body...")
-    email = extract_email_from_text(pr_body)
+def validate_email_address(email):
+    normalized_email, error = _validate_cached(email)
+    if normalized_email:
+        log(f"✅ Email validation passed: {normalized_email}")
+    else:
+        log(f"❌ Email validation failed: {error}")
+    return normalized_email
+
+def find_valid_email(extract, text, source):
+    email = extract(text)
     if email:
-        print(f"📧 Found email in PR body: {email}")
+        log(f"📧 Found email in {source}: {email}")
         validated_email = validate_email_address(email)
         if validated_email:
             return validated_email
-        else:
-            print("⚠️ Email in PR body is invalid, checking comments...")
-
-    print("🔍 No valid email found in PR body, checking comments...")
-    comments = fetch_pr_comments(repo_full_name, pr_number, github_token)
-    for comment in comments:
-        comment_body = comment.get("body", "")
-        email = extract_email_from_text(comment_body)
+        log(f"⚠️ Email in {source} is invalid, continuing search...")
+    return None
+
+def extract_email(pr_body, load_comments):
+    comments = None
+    # A labeled address anywhere in the thread beats a bare one, so look for
+    # those first and only fall back to bare addresses when none is valid
+    for kind, extract in (("labeled", extract_labeled_email), ("bare", extract_bare_email)):
+        log(f"🔍 Searching for {kind} email in PR body...")
+        email = find_valid_email(extract, pr_body, "PR body")
         if email:
-            print(f"📧 Found email in comment by {comment.get('user', {}).get('login', 'unknown')}: {email}")
-            validated_email = validate_email_address(email)
-            if validated_email:
-                return validated_email
-            else:
-                print("⚠️ Email in comment is invalid, continuing search...")
-
-    print("❌ No valid email found in PR body or comments. Skipping key issuance.")
+            return email
+
+        log(f"🔍 No valid {kind} email found in PR body, checking comments...")
+        if comments is None:
+            comments = load_comments()
+        for comment in comments:
+            author = comment.get("user", {}).get("login", "unknown")
+            email = find_valid_email(extract, comment.get("body", ""), f"comment by {author}")
+            if email:
+                return email
+
+    log_error("❌ No valid email found in PR body or comments. Skipping key issuance.")
     exit(2)
 
 def provision_api_key(provisioning_api_key):
-    print("🔐 Creating OpenRouter key...")
+    log("🔐 Creating OpenRouter key...")
     try:
-        key_resp = requests.post(
+        key_resp = SESSION.post(
             "https://openrouter.ai/api/v1/keys",
             headers={
                 "Authorization": f"Bearer {provisioning_api_key}",
@@ -155,74 +332,57 @@ def provision_api_key(provisioning_api_key):
         )
         key_resp.raise_for_status()
     except requests.exceptions.RequestException as e:
-        print("❌ Failed to provision API key:", str(e))
+        log_error(f"❌ Failed to provision API key: {e}")
         raise
-    key = key_resp.json().get("key")
+    key = _json_loads(key_resp.content).get("key")
     if not key:
-        print("❌ API response did not include a key.")
+        log_error("❌ API response did not include a key.")
         exit(2)
     return key
 
 def send_email(email, api_key, sendgrid_api_key):
-    print("📤 Sending email via SendGrid...")
+    log("📤 Sending email via SendGrid...")
+    # A single static message doesn't need the SendGrid SDK; post to the v3 API directly
+    payload = {
+        "personalizations": [{"to": [{"email": email}]}],
+        "from": {"email": "goose@opensource.block.xyz", "name": "goose team"},
+        "subject": "🎉 Your goose contributor API key",
+        "content": [{"type": "text/html", "value": _EMAIL_HTML_TEMPLATE.format(api_key=api_key)}]
+    }
     try:
-        sg = SendGridAPIClient(sendgrid_api_key)
-        from_email = "goose team <goose@opensource.block.xyz>"
-        subject = "🎉 Your goose contributor API key"
-        html_content = f"""
-            <p>Thank you for contributing to the <strong>goose recipe cookbook</strong>!</p>
-            <p>🎉 Here's your <strong>$10 OpenRouter API key</strong>:</p>
-            <pre style="background-color:#f4f4f4;padding:10px;border-radius:6px;"><code>{api_key}</code></pre>
-            <p>To use this in goose (CLI or Desktop):</p>
-            <ul>
-              <li>Go to your <strong>Provider Settings</strong></li>
-              <li>Select <strong>OpenRouter</strong> from the provider list</li>
-              <li>Paste your API key</li>
-            </ul>
-            <p>📚 Full setup instructions:<br>
-            <a href="https://block.github.io/goose/docs/getting-started/providers/#configure-provider">
-            https://block.github.io/goose/docs/getting-started/providers/#configure-provider</a></p>
-            <p>Happy coding!<br>– the goose team</p>
-        """
-        message = Mail(
-            from_email=from_email,
-            to_emails=email,
-            subject=subject,
-            html_content=html_content
+        response = SESSION.post(
+            "https://api.sendgrid.com/v3/mail/send",
+            headers={"Authorization": f"Bearer {sendgrid_api_key}"},
+            json=payload
         )
-        response = sg.send(message)
-        print(f"✅ Email sent successfully! Status code: {response.status_code}")
+        if response.status_code >= 400:
+            log(f"❌ SendGrid HTTP error {response.status_code}: {response.text}")
+            return False
+        log(f"✅ Email sent successfully! Status code: {response.status_code}")
         if response.status_code >= 300:
-            print(f"⚠️ Warning: Unexpected status code {response.status_code}")
-            print(f"Response body: {response.body}")
+            log(f"⚠️ Warning: Unexpected status code {response.status_code}")
+            log(f"Response body: {response.text}")
             return False
         return True
 
-    except HTTPError as e:
-        print(f"❌ SendGrid HTTP error {e.status_code}: {e.body}")
-        return False
-    except Exception as e:
-        print(f"❌ Unexpected error sending email: {type(e).__name__}: {e}")
+    except requests.exceptions.RequestException as e:
+        log(f"❌ Unexpected error sending email: {type(e).__name__}: {e}")
         return False
 
-def comment_on_pr(github_token, repo_full_name, pr_number, email):
-    print("💬 Commenting on PR...")
-    comment_url = f"https://api.github.com/repos/{repo_full_name}/issues/{pr_number}/comments"
+def comment_on_pr(comments_url, github_token, email):
+    log("💬 Commenting on PR...")
     try:
-        comment_resp = requests.post(
-            comment_url,
-            headers={
-                "Authorization": f"Bearer {github_token}",
-                "Accept": "application/vnd.github+json"
-            },
+        comment_resp = SESSION.post(
+            comments_url,
+            headers=github_headers(github_token),
             json={
                 "body": f"✅ $10 OpenRouter API key sent to `{email}`. Thanks for your contribution to the goose cookbook!"
             }
         )
         comment_resp.raise_for_status()
-        print("✅ Confirmation comment added to PR.")
+        log("✅ Confirmation comment added to PR.")
     except requests.exceptions.RequestException as e:
-        print("❌ Failed to comment on PR:", str(e))
+        log_error(f"❌ Failed to comment on PR: {e}")
         raise
 
 if __name__ == "__main__":
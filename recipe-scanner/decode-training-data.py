@@ -6,44 +6,130 @@ This script will be used inside the Docker container to decode GitHub secrets
 
 import json
 import base64
+import io
+import operator
 import os
+import sys
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+# pybase64 wraps libbase64's SIMD codec; fall back to the stdlib when the
+# container doesn't have it. Both skip non-alphabet characters (such as the
+# line breaks `base64` inserts) unless asked to validate.
+try:
+    import pybase64
+    _b64decode = pybase64.b64decode
+except ImportError:
+    _b64decode = base64.b64decode
+
+# Same idea for JSON: orjson's parser and encoder when present, stdlib otherwise
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _json_dumps_pretty(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps_pretty(obj):
+        return json.dumps(obj, indent=2).encode('utf-8')
+
+RISK_LEVELS = ["LOW", "MEDIUM", "HIGH", "EXTREME"]
+
+# The recipe fields each writer needs, fetched in a single call per recipe
+RECIPE_FILE_FIELDS = operator.itemgetter('filename', 'content', 'size_bytes', 'training_notes')
+RECIPE_NOTE_FIELDS = operator.itemgetter('filename', 'training_notes')
+
+NOTES_TEMPLATE = (
+    "Risk Level: {risk_level}\n"
+    "Filename: {filename}\n"
+    "Size: {size_bytes} bytes\n\n"
+    "Training Notes:\n"
+    "{training_notes}"
+)
+
+def get_env_bytes(name):
+    """
+    Read an environment variable as raw bytes where the platform allows it
+    os.environ decodes each value to str on access, which is wasted work for
+    multi-megabyte base64 blobs that are decoded to bytes straight afterwards
+    """
+    if os.supports_bytes_environ:
+        return os.environb.get(name.encode())
+    return os.environ.get(name)
+
+def decode_risk_level(risk_level, pool):
+    """
+    Decode and parse the training data envelope for a single risk level
+    Returns the parsed data and a future per recipe for its decoded content,
+    or None if its environment variable is not set
+    """
+    encoded_data = get_env_bytes(f"TRAINING_DATA_{risk_level}")
+    if not encoded_data:
+        return None
+    
+    # Decode the base64 outer layer
+    json_data = _b64decode(encoded_data)
+    
+    # Parse the JSON (both parsers take the UTF-8 bytes as-is)
+    parsed_data = _json_loads(json_data)
+    
+    # Hand each recipe's content to the pool straight away, so it decodes while
+    # other envelopes are still being parsed. Popping the base64 copy means it
+    # is freed as soon as its decode has run.
+    content_futures = [
+        pool.submit(_b64decode, recipe.pop('content_base64'))
+        for recipe in parsed_data['recipes']
+    ]
+    return parsed_data, content_futures
+
 def decode_training_data():
     """
     Decode all available training data from environment variables
     Returns a dictionary with risk levels and their decoded recipes
     """
     training_data = {}
+    status = []
     
-    # Check for each risk level
-    for risk_level in ["LOW", "MEDIUM", "HIGH", "EXTREME"]:
-        env_var = f"TRAINING_DATA_{risk_level}"
-        encoded_data = os.environ.get(env_var)
+    # Envelopes and recipe contents all decode on one pool; results are
+    # collected in the usual risk level order
+    with ThreadPoolExecutor() as pool:
+        futures = {risk_level: pool.submit(decode_risk_level, risk_level, pool) for risk_level in RISK_LEVELS}
         
-        if encoded_data:
+        for risk_level, future in futures.items():
             try:
-                # Decode the base64 outer layer
-                json_data = base64.b64decode(encoded_data).decode('utf-8')
-                
-                # Parse the JSON
-                parsed_data = json.loads(json_data)
-                
-                # Decode each recipe's content
-                for recipe in parsed_data.get('recipes', []):
-                    recipe_content = base64.b64decode(recipe['content_base64']).decode('utf-8')
-                    recipe['content'] = recipe_content
-                    # Keep the base64 version for reference but don't need it for analysis
-                
-                training_data[risk_level.lower()] = parsed_data
-                print(f"✅ Decoded {len(parsed_data['recipes'])} {risk_level.lower()} risk recipes")
-                
+                decoded = future.result()
+                if decoded is not None:
+                    parsed_data, content_futures = decoded
+                    recipes = parsed_data['recipes']
+                    for recipe, content_future in zip(recipes, content_futures):
+                        recipe['content'] = content_future.result().decode('utf-8')
+                    
+                    training_data[risk_level.lower()] = parsed_data
+                    status.append(f"✅ Decoded {len(recipes)} {risk_level.lower()} risk recipes")
             except Exception as e:
-                print(f"❌ Error decoding {env_var}: {e}")
+                status.append(f"❌ Error decoding TRAINING_DATA_{risk_level}: {e}")
+    
+    # Report all risk levels in one write
+    if status:
+        sys.stdout.write("\n".join(status) + "\n")
     
     return training_data
 
+def write_file_bytes(path, data):
+    """
+    Write bytes to a file with raw os calls, skipping Python's buffered IO layers
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
 def write_training_files(training_data, output_dir="/tmp/training"):
     """
     Write decoded training files to disk for Goose to analyze
@@ -59,44 +145,50 @@ def write_training_files(training_data, output_dir="/tmp/training"):
     }
     
     for risk_level, data in training_data.items():
-        risk_dir = output_path / risk_level
-        risk_dir.mkdir(exist_ok=True)
+        # Plain string paths: building Path objects twice per recipe adds up
+        risk_dir = os.path.join(str(output_path), risk_level)
+        os.makedirs(risk_dir, exist_ok=True)
+        risk_dir_prefix = risk_dir + os.sep
+        risk_label = risk_level.upper()
         
         recipes_info = []
         
-        for recipe in data.get('recipes', []):
+        for filename, content, size_bytes, training_notes in map(RECIPE_FILE_FIELDS, data['recipes']):
             # Write the recipe file
-            recipe_file = risk_dir / recipe['filename']
-            with open(recipe_file, 'w') as f:
-                f.write(recipe['content'])
+            recipe_file = risk_dir_prefix + filename
+            write_file_bytes(recipe_file, content.encode('utf-8'))
             
-            # Write the training notes
-            notes_file = risk_dir / f"{recipe['filename']}.notes.txt"
-            with open(notes_file, 'w') as f:
-                f.write(f"Risk Level: {risk_level.upper()}\n")
-                f.write(f"Filename: {recipe['filename']}\n")
-                f.write(f"Size: {recipe['size_bytes']} bytes\n\n")
-                f.write("Training Notes:\n")
-                f.write(recipe['training_notes'])
+            # Write the training notes in a single write
+            notes_file = recipe_file + ".notes.txt"
+            notes = NOTES_TEMPLATE.format(
+                risk_level=risk_label,
+                filename=filename,
+                size_bytes=size_bytes,
+                training_notes=training_notes
+            )
+            write_file_bytes(notes_file, notes.encode('utf-8'))
             
             recipes_info.append({
-                "filename": recipe['filename'],
-                "notes_file": str(notes_file),
-                "training_notes": recipe['training_notes']
+                "filename": filename,
+                "notes_file": notes_file,
+                "training_notes": training_notes
             })
         
+        count = len(recipes_info)
         summary["risk_levels"][risk_level] = {
-            "count": len(recipes_info),
+            "count": count,
             "recipes": recipes_info
         }
-        summary["total_recipes"] += len(recipes_info)
+        summary["total_recipes"] += count
     
     # Write the summary file
-    with open(output_path / "training_summary.json", 'w') as f:
-        json.dump(summary, f, indent=2)
+    write_file_bytes(output_path / "training_summary.json", _json_dumps_pretty(summary))
     
-    print(f"📁 Training data written to: {output_path}")
-    print(f"📊 Total recipes: {summary['total_recipes']}")
+    print(
+        f"📁 Training data written to: {output_path}",
+        f"📊 Total recipes: {summary['total_recipes']}",
+        sep="\n"
+    )
     
     return output_path
 
@@ -104,44 +196,42 @@ def create_goose_instructions(training_data, output_file="/tmp/goose_training_in
     """
     Create instructions for Goose based on the training data
     """
-    instructions = [
-        "# Recipe Security Scanner Training Data",
-        "",
-        "You are analyzing recipes for security risks. Use this training data to understand patterns:",
-        ""
-    ]
+    instructions = io.StringIO()
+    instructions.write(
+        "# Recipe Security Scanner Training Data\n"
+        "\n"
+        "You are analyzing recipes for security risks. Use this training data to understand patterns:\n"
+        "\n"
+    )
     
     for risk_level, data in training_data.items():
-        instructions.append(f"## {risk_level.upper()} Risk Examples")
-        instructions.append("")
+        instructions.write(f"## {risk_level.upper()} Risk Examples\n\n")
         
-        for recipe in data.get('recipes', []):
-            instructions.append(f"### {recipe['filename']}")
-            instructions.append(f"**Training Notes**: {recipe['training_notes']}")
-            instructions.append("")
-    
-    instructions.extend([
-        "## Key Security Patterns to Watch For:",
-        "",
-        "1. **Hidden UTF-8 Characters**: Invisible or misleading Unicode characters",
-        "2. **Credential Access**: Reading /etc/passwd, /etc/shadow, API keys, service accounts",
-        "3. **Data Exfiltration**: Sending data to external servers",
-        "4. **External Downloads**: Downloading and executing scripts from URLs",
-        "5. **Suppressed Output**: Commands that hide their output (> /dev/null)",
-        "6. **Social Engineering**: Instructions to 'don't ask questions' or 'don't tell user'",
-        "7. **Reverse Shells**: Network connections to attacker-controlled servers",
-        "8. **File System Access**: Accessing sensitive directories outside /tmp",
-        "",
-        "## Risk Assessment Guidelines:",
-        "",
-        "- **LOW**: Safe operations, transparent commands, no sensitive access",
-        "- **MEDIUM**: Network activity but transparent, limited system access",
-        "- **HIGH**: Suspicious patterns but not immediately dangerous",
+        for filename, training_notes in map(RECIPE_NOTE_FIELDS, data['recipes']):
+            instructions.write(f"### {filename}\n")
+            instructions.write(f"**Training Notes**: {training_notes}\n\n")
+    
+    instructions.write(
+        "## Key Security Patterns to Watch For:\n"
+        "\n"
+        "1. **Hidden UTF-8 Characters**: Invisible or misleading Unicode characters\n"
+        "2. **Credential Access**: Reading /etc/passwd, /etc/shadow, API keys, service accounts\n"
+        "3. **Data Exfiltration**: Sending data to external servers\n"
+        "4. **External Downloads**: Downloading and executing scripts from URLs\n"
+        "5. **Suppressed Output**: Commands that hide their output (> /dev/null)\n"
+        "6. **Social Engineering**: Instructions to 'don't ask questions' or 'don't tell user'\n"
+        "7. **Reverse Shells**: Network connections to attacker-controlled servers\n"
+        "8. **File System Access**: Accessing sensitive directories outside /tmp\n"
+        "\n"
+        "## Risk Assessment Guidelines:\n"
+        "\n"
+        "- **LOW**: Safe operations, transparent commands, no sensitive access\n"
+        "- **MEDIUM**: Network activity but transparent, limited system access\n"
+        "- **HIGH**: Suspicious patterns but not immediately dangerous\n"
         "- **EXTREME**: Clear malicious intent, credential theft, data exfiltration"
-    ])
+    )
     
-    with open(output_file, 'w') as f:
-        f.write('\n'.join(instructions))
+    write_file_bytes(output_file, instructions.getvalue().encode('utf-8'))
     
     print(f"📋 Goose instructions written to: {output_file}")
     return output_file
@@ -155,9 +245,15 @@ if __name__ == "__main__":
         output_dir = write_training_files(training_data)
         instructions_file = create_goose_instructions(training_data)
         
-        print("\n🎯 Training data ready for analysis!")
-        print(f"   Training files: {output_dir}")
-        print(f"   Instructions: {instructions_file}")
+        print(
+            "\n🎯 Training data ready for analysis!",
+            f"   Training files: {output_dir}",
+            f"   Instructions: {instructions_file}",
+            sep="\n"
+        )
     else:
-        print("❌ No training data found in environment variables")
-        print("   Expected: TRAINING_DATA_LOW, TRAINING_DATA_MEDIUM, TRAINING_DATA_EXTREME")
+        print(
+            "❌ No training data found in environment variables",
+            "   Expected: TRAINING_DATA_LOW, TRAINING_DATA_MEDIUM, TRAINING_DATA_EXTREME",
+            sep="\n"
+        )
@@ -9,6 +9,16 @@ import json
 import sys
 import uuid
 
+# orjson encodes straight to bytes for the binary pipe; fall back to the stdlib
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+    _json_loads = json.loads
+
 class AcpClient:
     def __init__(self):
         # Start the goose acp process
@@ -17,8 +27,9 @@ class AcpClient:
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True,
-            bufsize=0
+            # Binary, buffered pipes: no text-mode transcoding, and a whole
+            # request or response line per syscall instead of one per read
+            bufsize=64 * 1024
         )
         self.request_id = 0
         
@@ -33,9 +44,9 @@ class AcpClient:
             request["params"] = params
         
         # Send the request
-        request_str = json.dumps(request)
-        print(f">>> Sending: {request_str}")
-        self.process.stdin.write(request_str + '\n')
+        request_bytes = _json_dumps(request)
+        print(f">>> Sending: {request_bytes.decode('utf-8')}")
+        self.process.stdin.write(request_bytes + b'\n')
         self.process.stdin.flush()
         
         # Read response
@@ -43,8 +54,8 @@ class AcpClient:
         if not response_line:
             return None
             
-        print(f"<<< Response: {response_line}")
-        return json.loads(response_line)
+        print(f"<<< Response: {response_line.decode('utf-8')}")
+        return _json_loads(response_line)
     
     def initialize(self):
         return self.send_request("initialize", {